@@ -1,5 +1,14 @@
+import time
+
+# 记录开始导入的时间，用于统计启动耗时
+_started_at = time.monotonic()
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from routers.funds import router as funds_router
 from routers.data_sources import router as data_sources_router
 from routers.auth import router as auth_router
@@ -7,7 +16,53 @@ from routers.funds_management import router as funds_management_router
 from data_sources import DataSourceManager
 from database import init_db
 
-app = FastAPI(title="基金管理系统 API", version="1.0")
+DEFAULT_SOURCE = 'akshare'
+# 启动后在后台预热数据源(导入akshare/pandas、拉取全市场净值表)，设为0时按需加载
+WARMUP_ON_STARTUP = os.environ.get('WARMUP_ON_STARTUP', '1') == '1'
+WARMUP_RETRY = 30.0  # 预热失败后的重试间隔(秒)
+
+startup_state = {
+    'ready': False,
+    'startup_seconds': None,
+    'warmup_seconds': None,
+    'warmup_error': None,
+}
+
+
+def _warm_up():
+    """预热数据源，失败时保持未就绪并定期重试"""
+    start = time.monotonic()
+    while True:
+        try:
+            DataSourceManager.warm_up()
+            break
+        except Exception as e:
+            startup_state['warmup_error'] = str(e)
+            print(f"[startup] warm-up failed, retrying in {WARMUP_RETRY}s: {e}")
+            time.sleep(WARMUP_RETRY)
+    startup_state['warmup_error'] = None
+    startup_state['warmup_seconds'] = round(time.monotonic() - start, 3)
+    startup_state['ready'] = True
+    print(f"[startup] warm-up finished in {startup_state['warmup_seconds']}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 初始化数据库
+    init_db()
+    # 默认使用 AkShare 数据源(其他worker已切换过时沿用其选择)，首次使用时才加载
+    DataSourceManager.init_source(DEFAULT_SOURCE)
+
+    startup_state['startup_seconds'] = round(time.monotonic() - _started_at, 3)
+    print(f"[startup] started in {startup_state['startup_seconds']}s")
+    if WARMUP_ON_STARTUP:
+        app.state.warmup = asyncio.get_running_loop().run_in_executor(None, _warm_up)
+    else:
+        startup_state['ready'] = True
+    yield
+
+
+app = FastAPI(title="基金管理系统 API", version="1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,14 +70,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Data-Stale"],
 )
 
-# 默认使用 AkShare 数据源
-DataSourceManager.set_source('akshare')
-
-# 初始化数据库
-init_db()
-
 app.include_router(auth_router, prefix="/api/auth", tags=["auth"])
 app.include_router(funds_router, prefix="/api/funds", tags=["funds"])
 app.include_router(funds_management_router, prefix="/api/funds-management", tags=["funds-management"])
@@ -36,6 +86,19 @@ async def read_root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """就绪检查: 启动和预热成功后返回200，否则(包括预热失败)返回503"""
+    ready = startup_state['ready'] and startup_state['warmup_error'] is None
+    if ready:
+        status = "ready"
+    elif startup_state['warmup_error'] is not None:
+        status = "warmup_failed"
+    else:
+        status = "starting"
+    body = {"status": status, **startup_state}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,16 +1,50 @@
-from typing import Dict, Type
+import importlib
+import threading
+import time
+from typing import Dict, Type, Union
 from .base import BaseDataSource
-from .akshare import AkShareDataSource
-from .mock import MockDataSource
+from .shared_cache import get_shared_cache, deployment_id
+
+# 数据源选择只在当前部署(同一主进程下的worker)内共享，重启后回到默认数据源
+SOURCE_SETTING = f'data_source@{deployment_id()}'
+SYNC_INTERVAL = 1.0  # 多久从共享存储同步一次数据源选择(秒)
+
+# 数据源模块按需导入，避免启动时加载akshare/pandas
+_LAZY_CLASSES = {
+    'AkShareDataSource': '.akshare',
+    'AkShareEmDataSource': '.akshare_em',
+    'MockDataSource': '.mock',
+    'CompositeDataSource': '.composite',
+}
+
+# 数据源说明，列出可用数据源时不必导入模块
+_DESCRIPTIONS = {
+    'AkShareDataSource': 'AkShare真实行情数据',
+    'AkShareEmDataSource': 'AkShare东方财富全市场接口(基金列表、基金概况、全市场净值表)',
+    'MockDataSource': '固定的模拟数据，用于开发和演示',
+    'CompositeDataSource': '组合多个真实数据源，主数据源超过p95未返回时发出对冲请求，出错时按方法故障转移',
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_CLASSES:
+        return getattr(importlib.import_module(_LAZY_CLASSES[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class DataSourceManager:
-    _sources: Dict[str, Type[BaseDataSource]] = {
-        'akshare': AkShareDataSource,
-        'mock': MockDataSource
+    # 值为数据源类，或尚未导入的类名(见_LAZY_CLASSES)
+    _sources: Dict[str, Union[str, Type[BaseDataSource]]] = {
+        'akshare': 'AkShareDataSource',
+        'akshare_em': 'AkShareEmDataSource',
+        'mock': 'MockDataSource',
+        'composite': 'CompositeDataSource'
     }
     
     _current_source: BaseDataSource = None
     _current_source_name: str = None
+    _synced_at: float = 0.0
+    _lock = threading.RLock()
     
     @classmethod
     def register_source(cls, name: str, source_class: Type[BaseDataSource]):
@@ -18,27 +52,99 @@ class DataSourceManager:
         cls._sources[name] = source_class
     
     @classmethod
-    def set_source(cls, name: str):
-        """切换数据源"""
+    def get_source_class(cls, name: str) -> Type[BaseDataSource]:
+        """获取数据源类，首次使用时导入对应模块"""
         if name not in cls._sources:
             raise ValueError(f"Unknown data source: {name}")
-        
-        cls._current_source = cls._sources[name]()
-        cls._current_source_name = name
+        source_class = cls._sources[name]
+        if isinstance(source_class, str):
+            source_class = cls._sources[name] = __getattr__(source_class)
+        return source_class
+    
+    @classmethod
+    def create_source(cls, name: str) -> BaseDataSource:
+        """创建数据源实例"""
+        return cls.get_source_class(name)()
+    
+    @classmethod
+    def _activate(cls, name: str):
+        """选择数据源，实例在第一次get_source时创建"""
+        if name not in cls._sources:
+            raise ValueError(f"Unknown data source: {name}")
+        with cls._lock:
+            cls._current_source = None
+            cls._current_source_name = name
+    
+    @classmethod
+    def set_source(cls, name: str):
+        """切换数据源，并通知同一主机上的其他worker"""
+        cls._activate(name)
+        shared = get_shared_cache()
+        if shared is not None:
+            try:
+                shared.set_setting(SOURCE_SETTING, name)
+            except Exception as e:
+                print(f"[data_sources] save selection failed: {e}")
+        cls._synced_at = time.monotonic()
+    
+    @classmethod
+    def init_source(cls, default: str):
+        """启动时沿用其他worker已选择的数据源，没有时使用默认数据源"""
+        cls._synced_at = 0.0
+        cls._sync()
+        if cls._current_source_name is None:
+            cls.set_source(default)
+    
+    @classmethod
+    def _sync(cls):
+        """按SYNC_INTERVAL从共享存储读取数据源选择"""
+        now = time.monotonic()
+        if cls._synced_at and now - cls._synced_at < SYNC_INTERVAL:
+            return
+        cls._synced_at = now
+        shared = get_shared_cache()
+        if shared is None:
+            return
+        try:
+            name = shared.get_setting(SOURCE_SETTING)
+        except Exception as e:
+            print(f"[data_sources] load selection failed: {e}")
+            return
+        if name and name != cls._current_source_name and name in cls._sources:
+            cls._activate(name)
     
     @classmethod
     def get_source(cls) -> BaseDataSource:
         """获取当前数据源"""
-        if cls._current_source is None:
+        cls._sync()
+        if cls._current_source_name is None:
             cls.set_source('mock')
-        return cls._current_source
+        with cls._lock:
+            if cls._current_source is None:
+                cls._current_source = cls.create_source(cls._current_source_name)
+            return cls._current_source
     
     @classmethod
     def get_source_name(cls) -> str:
         """获取当前数据源名称"""
+        cls._sync()
         return cls._current_source_name
     
+    @classmethod
+    def warm_up(cls):
+        """提前导入并创建当前数据源，启动其后台任务"""
+        cls.get_source().warm_up()
+    
     @classmethod
     def get_available_sources(cls) -> Dict:
         """获取所有可用数据源"""
-        return {name: {'name': name, 'description': cls._sources[name].__doc__} for name in cls._sources}
\ No newline at end of file
+        return {name: {'name': name, 'description': cls._describe(source_class)}
+                for name, source_class in cls._sources.items()}
+    
+    @staticmethod
+    def _describe(source_class: Union[str, Type[BaseDataSource]]) -> str:
+        # 内置数据源使用静态说明；register_source注册的类使用其docstring
+        name = source_class if isinstance(source_class, str) else source_class.__name__
+        if name in _DESCRIPTIONS:
+            return _DESCRIPTIONS[name]
+        return source_class.__doc__ if not isinstance(source_class, str) else None
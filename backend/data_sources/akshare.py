@@ -1,17 +1,73 @@
+import threading
 import akshare as ak
 import pandas as pd
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 from .base import BaseDataSource
+from .estimation import EstimationEngine, HOLDINGS_FUNC, HOLDINGS_TTL, CALENDAR_FUNC, CALENDAR_TTL, MARKET_TZ
+from .nav_snapshot import NavSnapshotStore, NAV_FUNC
+from .resilience import get_guard, UpstreamUnavailable
+
+NAV_NOT_READY_RETRY = 5.0    # 全市场净值表尚未就绪时建议客户端重试的间隔(秒)
+
+# 个别上游接口的保护参数
+# 行情快照和全市场净值表由定时任务按max_age强制刷新，不使用这里的fresh_ttl
+GUARD_OPTIONS = {
+    HOLDINGS_FUNC: {'fresh_ttl': HOLDINGS_TTL},
+    CALENDAR_FUNC: {'fresh_ttl': CALENDAR_TTL},
+    NAV_FUNC: {'call_timeout': 60.0},
+    'fund_name_em': {'fresh_ttl': 24 * 3600.0, 'call_timeout': 30.0},
+}
 
 class AkShareDataSource(BaseDataSource):
+    # 进程内共享，子类也使用同一份(见get_engine/get_nav_store)
+    _engine: EstimationEngine = None
+    _nav_store: NavSnapshotStore = None
+    _shared_lock = threading.Lock()
+
+    def _call(self, func_name: str, **kwargs) -> Any:
+        """通过限流/熔断/缓存保护层调用AkShare接口"""
+        guard = get_guard(func_name, **GUARD_OPTIONS.get(func_name, {}))
+        return guard.call(getattr(ak, func_name), **kwargs)
+
+    def _fetch(self, func_name: str, max_age: float, **kwargs) -> Tuple[Any, datetime]:
+        """定时刷新使用: 不返回超过max_age的缓存，同时返回数据的实际获取时间(北京时间)"""
+        guard = get_guard(func_name, **GUARD_OPTIONS.get(func_name, {}))
+        value, fetched_at = guard.call_entry(getattr(ak, func_name), max_age=max_age, **kwargs)
+        return value, datetime.fromtimestamp(fetched_at, MARKET_TZ)
+
+    @classmethod
+    def get_engine(cls) -> EstimationEngine:
+        """所有实例共享一个估值引擎(及其行情刷新定时器)"""
+        # 预热线程和首批请求可能同时到达，加锁避免创建多个引擎
+        with AkShareDataSource._shared_lock:
+            if AkShareDataSource._engine is None:
+                source = AkShareDataSource()
+                AkShareDataSource._engine = EstimationEngine(source._call, source._fetch)
+            return AkShareDataSource._engine
+
+    @classmethod
+    def get_nav_store(cls) -> NavSnapshotStore:
+        """所有实例共享一份全市场净值表"""
+        # 加锁避免创建多个净值表，各自启动拉取线程
+        with AkShareDataSource._shared_lock:
+            if AkShareDataSource._nav_store is None:
+                AkShareDataSource._nav_store = NavSnapshotStore(AkShareDataSource()._fetch)
+            return AkShareDataSource._nav_store
+
+    def warm_up(self):
+        # 提前拉取全市场净值表，首个请求不必回退到单只基金接口
+        self.get_nav_store().start()
+
     def search_funds(self, keyword: str, limit: int = 20) -> List[Dict]:
         results = []
+        # 某个接口不可用时仍返回其他接口找到的结果，都没有结果时才返回503
+        unavailable = None
         try:
             if len(keyword) == 6 and keyword.isdigit():
                 # 方法1: 使用fund_individual_basic_info_xq获取基金基本信息
                 try:
-                    fund_basic = ak.fund_individual_basic_info_xq(symbol=keyword)
+                    fund_basic = self._call('fund_individual_basic_info_xq', symbol=keyword)
                     if not fund_basic.empty:
                         code = next(item['value'] for item in fund_basic.to_dict('records') if item['item'] == '基金代码')
                         name = next(item['value'] for item in fund_basic.to_dict('records') if item['item'] == '基金名称')
@@ -24,12 +80,14 @@ class AkShareDataSource(BaseDataSource):
                                 'full_name': full_name,
                                 'type': fund_type
                             })
+                except UpstreamUnavailable as e:
+                    unavailable = e
                 except Exception as e:
                     print(f"获取基金基本信息失败: {e}")
                 
                 # 方法2: 通过ETF基金信息获取
                 try:
-                    fund_etf = ak.fund_etf_fund_info_em(symbol=keyword)
+                    fund_etf = self._call('fund_etf_fund_info_em', symbol=keyword)
                     if not fund_etf.empty and not any(item['code'] == keyword for item in results):
                         results.append({
                             'code': keyword,
@@ -37,17 +95,23 @@ class AkShareDataSource(BaseDataSource):
                             'full_name': fund_etf['基金全称'].iloc[0],
                             'type': 'ETF'
                         })
+                except UpstreamUnavailable as e:
+                    unavailable = e
                 except Exception as e:
                     print(f"获取ETF基金信息失败: {e}")
             
+            if not results and unavailable is not None:
+                raise unavailable
             return results[:limit]
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             print(f"Search funds error: {e}")
             return []
 
     def get_fund_detail(self, fund_code: str) -> Dict:
         try:
-            fund_basic = ak.fund_individual_basic_info_xq(symbol=fund_code)
+            fund_basic = self._call('fund_individual_basic_info_xq', symbol=fund_code)
             
             if fund_basic.empty:
                 return {}
@@ -72,13 +136,76 @@ class AkShareDataSource(BaseDataSource):
             }
             
             return detail
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             print(f"Get fund detail error: {e}")
             return {}
 
     def get_fund_estimate(self, fund_code: str) -> Dict:
+        published = self._get_published_estimate(fund_code)
+        if not published:
+            return {}
+        return self._apply_estimates({fund_code: published}, wait=True)[fund_code]
+
+    def get_fund_estimates(self, fund_codes: List[str]) -> Dict[str, Dict]:
+        # 批量查询只使用全市场净值表和行情快照，不按基金逐只请求上游
+        store = self.get_nav_store()
+        store.start()
+        if store.current is None:
+            raise UpstreamUnavailable("全市场净值表尚未就绪", NAV_NOT_READY_RETRY)
+        published = {}
+        for fund_code in fund_codes:
+            nav = store.get(fund_code)
+            if nav is not None:
+                published[fund_code] = self._published_from_nav(fund_code, nav)
+        return self._apply_estimates(published, wait=False)
+
+    def _apply_estimates(self, published: Dict[str, Dict], wait: bool) -> Dict[str, Dict]:
+        """在公布的净值上叠加当前交易日的盘中估值"""
+        try:
+            changes, snapshot = self.get_engine().estimate_changes(list(published), wait=wait)
+        except Exception as e:
+            print(f"Estimate fund changes error: {e}")
+            changes, snapshot = {}, None
+
+        results = {}
+        for fund_code, nav in published.items():
+            change = changes.get(fund_code)
+            # 非交易时段、没有股票持仓，或当前交易日的净值已公布时直接使用公布的净值
+            if change is None or snapshot is None or str(nav['nav_date'])[:10] >= snapshot.session_date.isoformat():
+                results[fund_code] = nav
+                continue
+            base_nav = float(nav['unit_nav'])
+            results[fund_code] = {
+                **nav,
+                'estimate_value': round(base_nav * (1 + change / 100), 4),
+                'estimate_change': round(change, 2),
+                'estimate_time': snapshot.fetched_at.strftime('%Y-%m-%d %H:%M'),
+                'yesterday_nav': base_nav
+            }
+        return results
+
+    @staticmethod
+    def _published_from_nav(fund_code: str, nav: Dict) -> Dict:
+        return {
+            'code': fund_code,
+            'name': nav['name'],
+            'estimate_value': nav['unit_nav'],
+            'estimate_change': nav['change_pct'],
+            'estimate_time': nav['nav_date'],
+            'unit_nav': nav['unit_nav'],
+            'yesterday_nav': nav['prev_unit_nav'],
+            'nav_date': nav['nav_date']
+        }
+
+    def _get_published_estimate(self, fund_code: str) -> Dict:
+        """最近一次公布的净值，优先使用全市场净值表"""
+        nav = self.get_nav_store().get(fund_code)
+        if nav is not None:
+            return self._published_from_nav(fund_code, nav)
         try:
-            fund_open = ak.fund_open_fund_info_em(symbol=fund_code)
+            fund_open = self._call('fund_open_fund_info_em', symbol=fund_code)
             
             if not fund_open.empty:
                 latest = fund_open.iloc[-1]
@@ -91,7 +218,7 @@ class AkShareDataSource(BaseDataSource):
                 else:
                     yesterday_nav = latest['单位净值']  # 使用当日净值作为昨日净值
                 
-                result = {
+                return {
                     'code': fund_code,
                     'name': self.get_fund_name_by_code(fund_code),
                     'estimate_value': latest['单位净值'],
@@ -101,28 +228,41 @@ class AkShareDataSource(BaseDataSource):
                     'yesterday_nav': yesterday_nav,
                     'nav_date': latest['净值日期']
                 }
-                
-                print(f"[API] fund {fund_code}: estimate_value={result['estimate_value']}, estimate_change={result['estimate_change']}%, yesterday_nav={result['yesterday_nav']}")
-                return result
             return {}
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             print(f"Get fund estimate error for {fund_code}: {e}")
             return {}
     
     def get_fund_name_by_code(self, fund_code: str) -> str:
         try:
-            fund_basic = ak.fund_individual_basic_info_xq(symbol=fund_code)
+            fund_basic = self._call('fund_individual_basic_info_xq', symbol=fund_code)
             if not fund_basic.empty:
                 fund_info_dict = dict(zip(fund_basic['item'], fund_basic['value']))
                 return fund_info_dict.get('基金名称', fund_code)
             return fund_code
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             print(f"Get fund name error: {e}")
             return fund_code
 
     def get_fund_history(self, fund_code: str, start_date: str = None, end_date: str = None) -> List[Dict]:
+        nav = self.get_nav_store().get(fund_code)
+        latest = None
+        if nav is not None:
+            latest = {
+                'date': nav['nav_date'],
+                'unit_nav': nav['unit_nav'],
+                'accumulated_nav': nav['accumulated_nav'],
+                'change_pct': nav['change_pct']
+            }
+            # 只查询最新一天时不需要请求单只基金的历史
+            if start_date and start_date == nav['nav_date'] and (not end_date or end_date >= start_date):
+                return [latest]
         try:
-            fund_open = ak.fund_open_fund_info_em(symbol=fund_code)
+            fund_open = self._call('fund_open_fund_info_em', symbol=fund_code)
             
             if fund_open.empty:
                 return []
@@ -142,7 +282,14 @@ class AkShareDataSource(BaseDataSource):
                     'change_pct': row['日增长率']
                 })
             
+            # 单只基金的历史尚未更新到最新一天时，补上净值表中的数据
+            if latest is not None and (not start_date or start_date <= latest['date']) and (not end_date or end_date >= latest['date']):
+                if not history_list or str(history_list[-1]['date'])[:10] < latest['date']:
+                    history_list.append(latest)
+            
             return history_list
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             print(f"Get fund history error: {e}")
             return []
@@ -150,29 +297,22 @@ class AkShareDataSource(BaseDataSource):
     def get_fund_holdings(self, fund_code: str) -> List[Dict]:
         try:
             print(f"[DEBUG] Getting holdings for fund: {fund_code}")
-            fund_holdings = ak.fund_portfolio_hold_em(symbol=fund_code)
+            fund_holdings = self.get_engine().get_holdings(fund_code)
             
             print(f"[DEBUG] Raw holdings data shape: {fund_holdings.shape}")
             print(f"[DEBUG] Raw holdings columns: {list(fund_holdings.columns)}")
             
+            # 行情取自全市场快照(一次上游请求)，不再逐只股票请求日线
+            quotes = self.get_engine().get_quotes(fund_holdings['股票代码'].astype(str).tolist())
+            
             holdings_list = []
             for _, row in fund_holdings.iterrows():
-                stock_code = row['股票代码']
-                change = 0.0
-                open_price = 0.0
-                close_price = 0.0
-                volume = 0.0
-                
-                try:
-                    stock_history = ak.stock_zh_a_hist(symbol=stock_code, period="daily", start_date="20250101", end_date="20251231", adjust="qfq")
-                    if not stock_history.empty:
-                        latest = stock_history.tail(1)
-                        change = latest['涨跌幅'].values[0]
-                        open_price = latest['开盘'].values[0]
-                        close_price = latest['收盘'].values[0]
-                        volume = latest['成交量'].values[0]
-                except Exception as e:
-                    print(f"获取股票 {stock_code} 数据失败: {e}")
+                stock_code = str(row['股票代码'])
+                quote = quotes.get(stock_code, {})
+                change = quote.get('change', 0.0)
+                open_price = quote.get('open', 0.0)
+                close_price = quote.get('price', 0.0)
+                volume = quote.get('volume', 0.0)
                 
                 holdings_list.append({
                     'stock_code': stock_code,
@@ -187,13 +327,15 @@ class AkShareDataSource(BaseDataSource):
             
             print(f"[DEBUG] Returning {len(holdings_list)} holdings")
             return holdings_list[:10]
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             print(f"Get fund holding error: {e}")
             return []
 
     def get_fund_managers(self, fund_code: str) -> List[Dict]:
         try:
-            fund_managers = ak.fund_manager_em(symbol=fund_code)
+            fund_managers = self._call('fund_manager_em', symbol=fund_code)
             
             managers_list = []
             for _, row in fund_managers.iterrows():
@@ -205,6 +347,8 @@ class AkShareDataSource(BaseDataSource):
                 })
             
             return managers_list
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             print(f"Get fund managers error: {e}")
             return []
\ No newline at end of file
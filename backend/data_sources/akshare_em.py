@@ -0,0 +1,83 @@
+from typing import List, Dict
+from .akshare import AkShareDataSource
+from .resilience import UpstreamUnavailable
+
+NAME_LIST_FUNC = 'fund_name_em'
+OVERVIEW_FUNC = 'fund_overview_em'
+
+
+class AkShareEmDataSource(AkShareDataSource):
+    """使用AkShare另一组上游接口的数据源: 东方财富全市场基金列表、基金概况和全市场净值表"""
+
+    # 只有这些方法使用与AkShareDataSource不同的上游接口，组合数据源只把这些方法发给它
+    METHODS = ('search_funds', 'get_fund_detail', 'get_fund_history')
+    # 净值表只有最近两个交易日，历史净值只用于故障转移，不作为对冲结果
+    FAILOVER_ONLY = ('get_fund_history',)
+
+    def search_funds(self, keyword: str, limit: int = 20) -> List[Dict]:
+        try:
+            # 全市场基金列表，一次请求，按天缓存
+            funds = self._call(NAME_LIST_FUNC)
+            if funds.empty:
+                return []
+            codes = funds['基金代码'].astype(str)
+            matched = funds[(codes == keyword)
+                            | funds['基金简称'].astype(str).str.contains(keyword, regex=False)
+                            | funds['拼音缩写'].astype(str).str.contains(keyword.upper(), regex=False)]
+            return [{
+                'code': str(row['基金代码']),
+                'name': row['基金简称'],
+                'full_name': row['基金简称'],
+                'type': row['基金类型']
+            } for _, row in matched.head(limit).iterrows()]
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            print(f"Search funds (em) error: {e}")
+            return []
+
+    def get_fund_detail(self, fund_code: str) -> Dict:
+        try:
+            overview = self._call(OVERVIEW_FUNC, symbol=fund_code)
+            if overview.empty:
+                return {}
+            info = overview.iloc[0].to_dict()
+            return {
+                'code': str(info.get('基金代码', fund_code)),
+                'name': info.get('基金简称', ''),
+                'full_name': info.get('基金全称', ''),
+                'type': info.get('基金类型', ''),
+                'manager': info.get('基金经理人', ''),
+                'establish_date': str(info.get('成立日期/规模', '')).split('/')[0].strip(),
+                'scale': info.get('资产规模', ''),
+                'rating': '暂无评级',
+                'risk_level': '暂无评级',
+                'fund_company': info.get('基金管理人', ''),
+                'trustee_bank': info.get('基金托管人', ''),
+                'investment_strategy': '',
+                'investment_target': '',
+                'performance_benchmark': info.get('业绩比较基准', '')
+            }
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            print(f"Get fund detail (em) error: {e}")
+            return {}
+
+    def get_fund_history(self, fund_code: str, start_date: str = None, end_date: str = None) -> List[Dict]:
+        # 从全市场净值表的当前和上一份快照中取最近的净值，不请求单只基金的接口
+        store = self.get_nav_store()
+        store.start()
+        history = {}
+        for table in (store.previous, store.current):
+            nav = table.get(fund_code) if table is not None else None
+            if nav is None:
+                continue
+            history[nav['nav_date']] = {
+                'date': nav['nav_date'],
+                'unit_nav': nav['unit_nav'],
+                'accumulated_nav': nav['accumulated_nav'],
+                'change_pct': nav['change_pct']
+            }
+        return [item for date, item in sorted(history.items())
+                if (not start_date or date >= start_date) and (not end_date or date <= end_date)]
@@ -3,6 +3,10 @@ from datetime import datetime
 from typing import List, Dict, Optional, Any
 
 class BaseDataSource(ABC):
+    def warm_up(self):
+        """预热数据源(启动后台任务等)，默认不做任何事"""
+        pass
+
     @abstractmethod
     def search_funds(self, keyword: str, limit: int = 20) -> List[Dict]:
         """搜索基金"""
@@ -18,6 +22,15 @@ class BaseDataSource(ABC):
         """获取基金实时估值"""
         pass
 
+    def get_fund_estimates(self, fund_codes: List[str]) -> Dict[str, Dict]:
+        """批量获取基金实时估值，默认逐个调用get_fund_estimate"""
+        results = {}
+        for fund_code in fund_codes:
+            estimate = self.get_fund_estimate(fund_code)
+            if estimate:
+                results[fund_code] = estimate
+        return results
+
     @abstractmethod
     def get_fund_history(self, fund_code: str, start_date: str = None, end_date: str = None) -> List[Dict]:
         """获取基金历史净值"""
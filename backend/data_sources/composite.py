@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextvars import copy_context
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from .base import BaseDataSource
+from .mock import MockDataSource
+from .resilience import (get_stale_age, mark_stale, reset_stale,
+                         get_upstream_calls, reset_upstream_calls, UpstreamUnavailable)
+
+# 默认按顺序组合的数据源，排在前面的为主数据源。
+# 只能组合真实数据源: Mock返回的是固定的假数据，不能作为对冲或故障转移目标。
+# akshare_em使用AkShare的另一组上游接口(东方财富全市场基金列表、基金概况、全市场净值表)。
+DEFAULT_BACKENDS = ('akshare', 'akshare_em')
+HEDGE_DELAY = 1.0        # 样本不足时发出对冲请求前的等待时间(秒)
+MIN_HEDGE_DELAY = 0.05   # 对冲等待时间下限(秒)
+MIN_SAMPLES = 20         # 使用p95前至少需要的延迟样本数
+WINDOW = 200             # 每个数据源每个方法保留的延迟样本数
+
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="composite")
+
+
+class _LatencyWindow:
+    """滑动窗口内的成功请求延迟"""
+
+    def __init__(self, size: int = WINDOW):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+class CompositeDataSource(BaseDataSource):
+    """组合多个数据源，主数据源超过p95未返回时发出对冲请求，出错时按方法故障转移
+
+    数据源可以声明METHODS(只参与其中的方法)和FAILOVER_ONLY(这些方法只用于故障转移，不发对冲请求)。
+    """
+
+    def __init__(self, backends: Optional[Sequence[Union[str, Tuple[str, BaseDataSource]]]] = None):
+        from . import DataSourceManager
+
+        self.backends: List[Tuple[str, BaseDataSource]] = []
+        for backend in backends or DEFAULT_BACKENDS:
+            if isinstance(backend, str):
+                backend = (backend, DataSourceManager.create_source(backend))
+            if isinstance(backend[1], MockDataSource):
+                raise ValueError(f"CompositeDataSource cannot use mock data source '{backend[0]}'")
+            self.backends.append(backend)
+        if not self.backends:
+            raise ValueError("CompositeDataSource requires at least one backend")
+        self._latency: Dict[Tuple[str, str], _LatencyWindow] = {}
+        self._lock = threading.Lock()
+
+    def _window(self, name: str, method: str) -> _LatencyWindow:
+        with self._lock:
+            window = self._latency.get((name, method))
+            if window is None:
+                window = self._latency[(name, method)] = _LatencyWindow()
+            return window
+
+    def _hedge_delay(self, name: str, method: str) -> float:
+        p95 = self._window(name, method).p95()
+        if p95 is None:
+            return HEDGE_DELAY
+        return max(p95, MIN_HEDGE_DELAY)
+
+    def _backends_for(self, method: str) -> List[Tuple[str, BaseDataSource]]:
+        return [(name, source) for name, source in self.backends
+                if method in getattr(source, 'METHODS', (method,))]
+
+    def _run(self, name: str, source: BaseDataSource, method: str, args: tuple) -> Tuple[Any, Optional[float]]:
+        """调用单个数据源，返回结果和过期数据年龄"""
+        reset_stale()
+        reset_upstream_calls()
+        start = time.monotonic()
+        result = getattr(source, method)(*args)
+        # 只记录实际请求了上游的延迟，缓存命中会把p95拉低，导致几乎每次都发对冲请求
+        if result and get_upstream_calls():
+            self._window(name, method).record(time.monotonic() - start)
+        return result, get_stale_age()
+
+    def _dispatch(self, method: str, *args) -> Any:
+        backends = self._backends_for(method)
+        if len(backends) == 1:
+            # 只有一个数据源提供该方法时直接调用，不经过线程池
+            name, source = backends[0]
+            try:
+                return self._run(name, source, method, args)[0]
+            except UpstreamUnavailable:
+                raise
+            except Exception as e:
+                print(f"[composite] {name}.{method} error: {e}")
+                return None
+
+        pending = {}
+        launched = 0
+        fallback = None
+        unavailable = None
+
+        def launch():
+            nonlocal launched
+            name, source = backends[launched]
+            launched += 1
+            future = _executor.submit(copy_context().run, self._run, name, source, method, args)
+            pending[future] = name
+
+        launch()
+        while pending:
+            timeout = None
+            if launched < len(backends) and method not in getattr(backends[launched][1], 'FAILOVER_ONLY', ()):
+                timeout = self._hedge_delay(backends[launched - 1][0], method)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # 对冲: 上一个数据源超过p95未返回，同时请求下一个
+                launch()
+                continue
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result, stale_age = future.result()
+                except UpstreamUnavailable as e:
+                    unavailable = e
+                    continue
+                except Exception as e:
+                    print(f"[composite] {name}.{method} error: {e}")
+                    continue
+                if result:
+                    if stale_age is not None:
+                        mark_stale(stale_age)
+                    return result
+                if fallback is None:
+                    fallback = result
+            if not pending and launched < len(backends):
+                # 故障转移: 已发出的请求全部失败或为空
+                launch()
+        if fallback is None and unavailable is not None:
+            # 所有数据源都不可用时向上抛出，由路由返回503
+            raise unavailable
+        return fallback
+
+    def warm_up(self):
+        for _, source in self.backends:
+            source.warm_up()
+
+    def get_latency_stats(self) -> Dict:
+        """获取各数据源各方法的p95延迟"""
+        with self._lock:
+            windows = dict(self._latency)
+        return {f"{name}.{method}": window.p95() for (name, method), window in windows.items()}
+
+    def search_funds(self, keyword: str, limit: int = 20) -> List[Dict]:
+        return self._dispatch('search_funds', keyword, limit) or []
+
+    def get_fund_detail(self, fund_code: str) -> Dict:
+        return self._dispatch('get_fund_detail', fund_code) or {}
+
+    def get_fund_estimate(self, fund_code: str) -> Dict:
+        return self._dispatch('get_fund_estimate', fund_code) or {}
+
+    def get_fund_estimates(self, fund_codes: List[str]) -> Dict[str, Dict]:
+        return self._dispatch('get_fund_estimates', fund_codes) or {}
+
+    def get_fund_history(self, fund_code: str, start_date: str = None, end_date: str = None) -> List[Dict]:
+        return self._dispatch('get_fund_history', fund_code, start_date, end_date) or []
+
+    def get_fund_holdings(self, fund_code: str) -> List[Dict]:
+        return self._dispatch('get_fund_holdings', fund_code) or []
+
+    def get_fund_managers(self, fund_code: str) -> List[Dict]:
+        return self._dispatch('get_fund_managers', fund_code) or []
@@ -0,0 +1,283 @@
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timedelta, timezone, time as day_time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import pandas as pd
+from .resilience import UpstreamUnavailable, UPSTREAM_ERRORS
+
+QUOTE_REFRESH = 30.0          # A股实时行情快照刷新间隔(秒)
+QUOTE_IDLE_STOP = 600.0       # 超过该时间无估值请求时暂停刷新(秒)
+HOLDINGS_TTL = 12 * 3600.0    # 基金持仓权重缓存时间(秒)，持仓按季度披露
+HOLDINGS_RETRY = 600.0        # 持仓加载失败后多久再试(秒)
+CALENDAR_TTL = 24 * 3600.0    # 交易日历缓存时间(秒)
+CALENDAR_RETRY = 600.0        # 交易日历加载失败后多久再试(秒)
+
+QUOTE_FUNC = 'stock_zh_a_spot_em'
+HOLDINGS_FUNC = 'fund_portfolio_hold_em'
+CALENDAR_FUNC = 'tool_trade_date_hist_sina'
+
+# A股交易时间按北京时间计算，与服务器时区无关
+MARKET_TZ = timezone(timedelta(hours=8))
+SESSION_OPEN = day_time(9, 30)
+SESSION_FINAL = day_time(15, 5)   # 此后取到的行情视为当日收盘行情，不再刷新
+
+# 行情快照保留的列
+QUOTE_COLUMNS = {'涨跌幅': 'change', '最新价': 'price', '今开': 'open', '成交量': 'volume'}
+
+
+class QuoteSnapshot:
+    """一次全市场A股行情快照，按股票代码索引"""
+
+    def __init__(self, quotes: pd.DataFrame, fetched_at: datetime, session_date: Optional[date]):
+        # 列: change(涨跌幅%), price, open, volume
+        self.quotes = quotes
+        self.returns = quotes['change']
+        # 上游实际返回数据的时间(北京时间)，及其所属交易日(开盘前/非交易日取到的快照为None)
+        self.fetched_at = fetched_at
+        self.session_date = session_date
+
+
+class EstimationEngine:
+    """根据基金披露的持仓权重和A股实时行情批量估算基金净值涨跌幅"""
+
+    def __init__(self, call: Callable[..., Any], fetch: Callable[..., Tuple[Any, datetime]]):
+        # call(func_name, **kwargs) 经过限流/熔断/缓存保护调用AkShare
+        # fetch(func_name, max_age, **kwargs) 同上，但不返回超过max_age的缓存，并返回实际获取时间
+        self._call = call
+        self._fetch = fetch
+        self._snapshot: Optional[QuoteSnapshot] = None
+        self._weights: Dict[str, Tuple[pd.Series, float]] = {}
+        self._calendar: Optional[Tuple[Optional[frozenset], str, float]] = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._timer: Optional[threading.Thread] = None
+        self._last_used = 0.0
+        # 待后台加载持仓的基金
+        self._queue: deque = deque()
+        self._queued = set()
+        self._loader: Optional[threading.Thread] = None
+
+    def _trade_dates(self) -> Tuple[Optional[frozenset], str]:
+        """交易日历(日期字符串集合, 最后一天)，加载失败时为(None, '')"""
+        with self._lock:
+            cached = self._calendar
+        if cached is not None and time.monotonic() - cached[2] < CALENDAR_TTL:
+            return cached[0], cached[1]
+        try:
+            frame = self._call(CALENDAR_FUNC)
+            dates = frozenset(str(day)[:10] for day in frame['trade_date'])
+            last = max(dates)
+            loaded_at = time.monotonic()
+        except Exception as e:
+            print(f"[estimation] load trade calendar failed: {e}")
+            dates, last = (cached[0], cached[1]) if cached is not None else (None, '')
+            loaded_at = time.monotonic() - CALENDAR_TTL + CALENDAR_RETRY
+        with self._lock:
+            self._calendar = (dates, last, loaded_at)
+        return dates, last
+
+    def is_trading_day(self, day: date) -> bool:
+        dates, last = self._trade_dates()
+        key = day.isoformat()
+        if dates is None or key > last:
+            # 没有日历时按工作日处理
+            return day.weekday() < 5
+        return key in dates
+
+    def current_session(self, now: Optional[datetime] = None) -> Optional[date]:
+        """当前所属的交易日；非交易日或当天尚未开盘时返回None"""
+        now = (now or datetime.now(MARKET_TZ)).astimezone(MARKET_TZ)
+        if now.time() < SESSION_OPEN or not self.is_trading_day(now.date()):
+            return None
+        return now.date()
+
+    def _load_snapshot(self) -> Optional[QuoteSnapshot]:
+        spot, fetched_at = self._fetch(QUOTE_FUNC, max_age=QUOTE_REFRESH)
+        if spot is None or spot.empty:
+            return None
+        quotes = pd.DataFrame({
+            name: pd.to_numeric(spot[column], errors='coerce') if column in spot.columns else float('nan')
+            for column, name in QUOTE_COLUMNS.items()
+        }).fillna(0.0)
+        quotes.index = spot['代码'].astype(str)
+        return QuoteSnapshot(quotes[~quotes.index.duplicated()], fetched_at, self.current_session(fetched_at))
+
+    def refresh_quotes(self):
+        """刷新行情快照，同一时间只有一个线程请求上游"""
+        with self._refresh_lock:
+            try:
+                snapshot = self._load_snapshot()
+            except Exception as e:
+                print(f"[estimation] refresh quotes failed: {e}")
+                return
+            if snapshot is not None:
+                self._snapshot = snapshot
+
+    def _should_refresh(self) -> bool:
+        """只在交易时段内刷新，取到当日收盘行情后停止"""
+        session = self.current_session()
+        if session is None:
+            return False
+        snapshot = self._snapshot
+        return not (snapshot is not None and snapshot.session_date == session
+                    and snapshot.fetched_at.time() >= SESSION_FINAL)
+
+    def _run_timer(self):
+        while time.monotonic() - self._last_used < QUOTE_IDLE_STOP:
+            time.sleep(QUOTE_REFRESH)
+            if self._should_refresh():
+                self.refresh_quotes()
+        with self._lock:
+            self._timer = None
+
+    def _ensure_timer(self):
+        self._last_used = time.monotonic()
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Thread(target=self._run_timer, name="quote-refresh", daemon=True)
+                self._timer.start()
+
+    def get_snapshot(self, force: bool = False) -> Optional[QuoteSnapshot]:
+        """获取行情快照
+
+        交易时段内快照缺失或不属于当前交易日时同步刷新；force时非交易时段也至少加载一次。
+        """
+        self._ensure_timer()
+        snapshot = self._snapshot
+        session = self.current_session()
+        expired = session is not None and (snapshot is None or snapshot.session_date != session)
+        if expired or (force and snapshot is None):
+            self.refresh_quotes()
+        return self._snapshot
+
+    def get_quotes(self, stock_codes: List[str]) -> Dict[str, Dict]:
+        """查询行情快照: 股票代码 -> {change, price, open, volume}，快照中没有的股票不返回"""
+        snapshot = self.get_snapshot(force=True)
+        if snapshot is None:
+            return {}
+        return snapshot.quotes.reindex(list(dict.fromkeys(stock_codes))).dropna().to_dict('index')
+
+    def _parse_weights(self, holdings: pd.DataFrame) -> pd.Series:
+        if holdings is None or holdings.empty:
+            return pd.Series(dtype=float)
+        if '季度' in holdings.columns:
+            # 只使用最近一期披露的持仓
+            holdings = holdings[holdings['季度'] == holdings['季度'].max()]
+        weights = pd.to_numeric(holdings['占净值比例'], errors='coerce').fillna(0.0)
+        weights.index = holdings['股票代码'].astype(str)
+        return weights.groupby(level=0).sum()
+
+    def get_holdings(self, fund_code: str) -> Optional[pd.DataFrame]:
+        """基金当年披露的持仓明细，当年尚未披露(如一季度)时使用上一年"""
+        # fund_portfolio_hold_em不传date时使用固定年份，必须显式传入当前年份
+        year = datetime.now(MARKET_TZ).year
+        try:
+            holdings = self._call(HOLDINGS_FUNC, symbol=fund_code, date=str(year))
+        except (UpstreamUnavailable,) + UPSTREAM_ERRORS:
+            raise
+        except Exception as e:
+            # 当年没有数据时接口可能直接报错
+            print(f"[estimation] holdings for {fund_code} in {year} failed: {e}")
+            holdings = None
+        if holdings is None or holdings.empty:
+            holdings = self._call(HOLDINGS_FUNC, symbol=fund_code, date=str(year - 1))
+        return holdings
+
+    def _load_weights(self, fund_code: str) -> pd.Series:
+        # 持仓经保护层缓存并写入共享缓存，其他worker和重启后不必再请求上游
+        weights = self._parse_weights(self.get_holdings(fund_code))
+        with self._lock:
+            self._weights[fund_code] = (weights, time.monotonic())
+        return weights
+
+    def get_weights(self, fund_code: str) -> pd.Series:
+        """获取基金持仓权重: 股票代码 -> 占净值比例(%)，缓存过期时同步加载"""
+        with self._lock:
+            cached = self._weights.get(fund_code)
+        if cached is not None and time.monotonic() - cached[1] < HOLDINGS_TTL:
+            return cached[0]
+        try:
+            return self._load_weights(fund_code)
+        except Exception as e:
+            print(f"[estimation] holdings for {fund_code} failed: {e}")
+            return cached[0] if cached is not None else pd.Series(dtype=float)
+
+    def _queue_weights(self, fund_codes: List[str]):
+        """把需要加载持仓的基金交给后台线程，请求线程不等待"""
+        with self._lock:
+            for code in fund_codes:
+                if code not in self._queued:
+                    self._queued.add(code)
+                    self._queue.append(code)
+            if self._queue and self._loader is None:
+                self._loader = threading.Thread(target=self._run_loader, name="holdings-loader", daemon=True)
+                self._loader.start()
+
+    def _defer_weights(self, fund_code: str):
+        """加载失败的基金保留原有权重，HOLDINGS_RETRY秒后才会再次加入队列"""
+        with self._lock:
+            previous = self._weights.get(fund_code)
+            weights = previous[0] if previous is not None else pd.Series(dtype=float)
+            self._weights[fund_code] = (weights, time.monotonic() - HOLDINGS_TTL + HOLDINGS_RETRY)
+
+    def _run_loader(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._loader = None
+                    return
+                code = self._queue.popleft()
+            pause = 0.0
+            try:
+                self._load_weights(code)
+            except UpstreamUnavailable as e:
+                # 限流、熔断或超时: 这只基金推迟重试，稍等后继续加载其他基金，不阻塞队列
+                print(f"[estimation] holdings for {code} unavailable: {e}")
+                self._defer_weights(code)
+                pause = e.retry_after
+            except Exception as e:
+                print(f"[estimation] holdings for {code} failed: {e}")
+                self._defer_weights(code)
+            with self._lock:
+                self._queued.discard(code)
+            if pause:
+                time.sleep(pause)
+
+    def estimate_changes(self, fund_codes: List[str], wait: bool = False) -> Tuple[Dict[str, float], Optional[QuoteSnapshot]]:
+        """批量估算当前交易日的涨跌幅(%)，返回(基金代码 -> 估算涨跌幅, 使用的行情快照)
+
+        非交易日或开盘前不估算。持仓尚未加载的基金由后台加载，本次不出现在结果中；
+        wait为True时(单只基金)同步加载。未披露部分按当日不变处理。
+        """
+        session = self.current_session()
+        if session is None:
+            return {}, None
+        snapshot = self.get_snapshot()
+        if snapshot is None or snapshot.session_date != session:
+            return {}, None
+        columns = {}
+        missing = []
+        now = time.monotonic()
+        for code in fund_codes:
+            if wait:
+                weights = self.get_weights(code)
+            else:
+                with self._lock:
+                    cached = self._weights.get(code)
+                if cached is None or now - cached[1] >= HOLDINGS_TTL:
+                    missing.append(code)
+                if cached is None:
+                    continue
+                weights = cached[0]
+            if not weights.empty:
+                columns[code] = weights
+        if missing:
+            self._queue_weights(missing)
+        if not columns:
+            return {}, snapshot
+        # 股票 x 基金 的权重矩阵与行情收益率向量相乘
+        weight_matrix = pd.DataFrame(columns).fillna(0.0)
+        returns = snapshot.returns.reindex(weight_matrix.index).fillna(0.0)
+        changes = weight_matrix.to_numpy().T @ returns.to_numpy() / 100.0
+        return dict(zip(weight_matrix.columns, changes.tolist())), snapshot
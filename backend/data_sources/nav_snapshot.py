@@ -0,0 +1,142 @@
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+import pandas as pd
+
+NAV_FUNC = 'fund_open_fund_daily_em'
+NAV_REFRESH = 1800.0         # 全市场净值表刷新间隔(秒)
+NAV_RETRY = 60.0             # 拉取失败后的重试间隔(秒)
+
+_NAV_COLUMN = re.compile(r'^(\d{4}-\d{2}-\d{2})-单位净值$')
+
+
+class NavTable:
+    """全市场开放式基金最新净值，按基金代码索引的列式表"""
+
+    def __init__(self, frame: pd.DataFrame, nav_date: str, ingested_at: datetime):
+        # 列: name, unit_nav, accumulated_nav, prev_unit_nav, change_pct, nav_date
+        self.frame = frame
+        self.nav_date = nav_date
+        self.ingested_at = ingested_at
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def get(self, fund_code: str) -> Optional[Dict]:
+        if fund_code not in self.frame.index:
+            return None
+        row = self.frame.loc[fund_code]
+        return {
+            'code': fund_code,
+            'name': row['name'],
+            'unit_nav': float(row['unit_nav']),
+            'accumulated_nav': float(row['accumulated_nav']),
+            'prev_unit_nav': float(row['prev_unit_nav']),
+            'change_pct': float(row['change_pct']),
+            'nav_date': row['nav_date'],
+        }
+
+
+def normalize(raw: pd.DataFrame, ingested_at: datetime = None) -> NavTable:
+    """把fund_open_fund_daily_em的宽表(列名带日期)整理成NavTable"""
+    dates = sorted((m.group(1) for m in map(_NAV_COLUMN.match, raw.columns) if m), reverse=True)
+    if not dates:
+        raise ValueError("no unit NAV columns in daily NAV table")
+    latest = dates[0]
+    previous = dates[1] if len(dates) > 1 else latest
+
+    def column(date: str, kind: str) -> pd.Series:
+        return pd.to_numeric(raw[f'{date}-{kind}'], errors='coerce')
+
+    unit_nav = column(latest, '单位净值')
+    prev_unit_nav = column(previous, '单位净值')
+    # 当日净值尚未公布的基金沿用上一日净值
+    published = unit_nav.notna()
+    frame = pd.DataFrame({
+        'name': raw['基金简称'].astype(str),
+        'unit_nav': unit_nav.where(published, prev_unit_nav),
+        'accumulated_nav': column(latest, '累计净值').where(published, column(previous, '累计净值')),
+        'prev_unit_nav': prev_unit_nav.where(published),
+        'change_pct': pd.to_numeric(raw['日增长率'], errors='coerce').where(published),
+        'nav_date': pd.Categorical(published.map({True: latest, False: previous})),
+    })
+    frame.index = raw['基金代码'].astype(str)
+    frame = frame[frame['unit_nav'].notna() & ~frame.index.duplicated()]
+    derived = (frame['unit_nav'] / frame['prev_unit_nav'] - 1) * 100
+    frame['change_pct'] = frame['change_pct'].fillna(derived.round(2)).fillna(0.0)
+    return NavTable(frame.sort_index(), latest, ingested_at or datetime.now())
+
+
+class NavSnapshotStore:
+    """定时拉取全市场每日净值表，保留当前和上一交易日的快照"""
+
+    def __init__(self, fetch: Callable[..., Tuple[Any, datetime]], interval: float = NAV_REFRESH):
+        # fetch(func_name, max_age, **kwargs) 经过限流/熔断保护调用AkShare，返回(数据, 实际获取时间)
+        self._fetch = fetch
+        self.interval = interval
+        self.current: Optional[NavTable] = None
+        self.previous: Optional[NavTable] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {'ingestions': 0, 'failures': 0, 'rows': 0, 'nav_date': None,
+                      'fetch_seconds': None, 'normalize_seconds': None, 'ingested_at': None}
+
+    def refresh(self) -> bool:
+        """拉取一次全市场净值表"""
+        try:
+            start = time.monotonic()
+            # 定时刷新强制请求上游(只复用其他worker在NAV_RETRY内取到的数据)，ingested_at为实际获取时间
+            raw, fetched_at = self._fetch(NAV_FUNC, max_age=NAV_RETRY)
+            fetched = time.monotonic()
+            table = normalize(raw, fetched_at)
+            done = time.monotonic()
+        except Exception as e:
+            self.stats['failures'] += 1
+            print(f"[nav_snapshot] ingestion failed: {e}")
+            return False
+
+        with self._lock:
+            if self.current is not None and self.current.nav_date != table.nav_date:
+                self.previous = self.current
+            self.current = table
+        self.stats.update({
+            'ingestions': self.stats['ingestions'] + 1,
+            'rows': len(table),
+            'nav_date': table.nav_date,
+            'fetch_seconds': round(fetched - start, 3),
+            'normalize_seconds': round(done - fetched, 3),
+            'ingested_at': table.ingested_at.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        print(f"[nav_snapshot] {len(table)} funds for {table.nav_date}: "
+              f"fetch {fetched - start:.2f}s, normalize {done - fetched:.2f}s")
+        return True
+
+    def _run(self):
+        while True:
+            ok = self.refresh()
+            time.sleep(self.interval if ok else NAV_RETRY)
+
+    def start(self):
+        """启动后台定时拉取(重复调用无副作用)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="nav-snapshot", daemon=True)
+                self._thread.start()
+
+    def get(self, fund_code: str) -> Optional[Dict]:
+        """查询基金最新净值，表尚未就绪或没有该基金时返回None"""
+        self.start()
+        table = self.current
+        if table is None:
+            return None
+        row = table.get(fund_code)
+        if row is not None and pd.isna(row['prev_unit_nav']):
+            # 宽表里没有昨日净值时，用上一次保留的快照
+            prev = self.previous.get(fund_code) if self.previous is not None else None
+            if prev is not None and prev['nav_date'] < row['nav_date']:
+                row['prev_unit_nav'] = prev['unit_nav']
+            else:
+                row['prev_unit_nav'] = row['unit_nav']
+        return row
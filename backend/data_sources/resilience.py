@@ -0,0 +1,415 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from .shared_cache import get_shared_cache
+
+# 上游调用默认参数
+RATE_PER_SECOND = 5.0        # 每个上游函数每秒允许的请求数
+BURST = 10                   # 令牌桶容量
+CALL_TIMEOUT = 8.0           # 单次上游调用超时(秒)
+LIMIT_WAIT = 0.2             # 令牌桶为空时最多等待的时间(秒)，超过即快速失败
+FAILURE_THRESHOLD = 5        # 连续失败多少次后熔断
+RESET_TIMEOUT = 30.0         # 熔断后多久进入半开状态(秒)
+FRESH_TTL = 60.0             # 缓存结果视为新鲜的时间(秒)
+MAX_STALE = 24 * 3600.0      # 上游异常时最多返回多旧的数据(秒)
+MAX_ENTRIES = 1024           # 每个上游函数缓存的结果数
+LEASE_POLL = 0.05            # 等待其他worker取数时的首次轮询间隔(秒)，之后按倍数退避
+LEASE_POLL_MAX = 0.5         # 轮询间隔上限(秒)
+LEASE_MARGIN = 1.0           # 租约在最坏耗时之外多保留的时间(秒)
+
+# 计入熔断的异常: 网络/连接错误(requests的异常都是OSError的子类)，超时另行处理。
+# 其他异常(参数错误、基金代码不存在引起的KeyError等)只与具体请求有关，不触发熔断。
+UPSTREAM_ERRORS = (OSError,)
+
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="upstream")
+# 后台刷新单独使用线程池，避免与上游调用互相等待
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="upstream-refresh")
+
+# 当前请求是否返回了过期数据
+_stale: ContextVar[Optional[float]] = ContextVar("upstream_stale", default=None)
+# 当前请求实际发起的上游调用次数(缓存命中不计)
+_upstream_calls: ContextVar[int] = ContextVar("upstream_calls", default=0)
+
+
+def reset_stale():
+    """清除当前请求的过期标记"""
+    _stale.set(None)
+
+
+def get_stale_age() -> Optional[float]:
+    """返回当前请求中最旧的过期数据的年龄(秒)，没有过期数据时返回None"""
+    return _stale.get()
+
+
+def mark_stale(age: float):
+    """记录当前请求返回了过期数据"""
+    current = _stale.get()
+    if current is None or age > current:
+        _stale.set(age)
+
+
+def reset_upstream_calls():
+    _upstream_calls.set(0)
+
+
+def get_upstream_calls() -> int:
+    """当前请求中实际请求上游的次数，用于只统计真实的上游延迟"""
+    return _upstream_calls.get()
+
+
+class UpstreamUnavailable(Exception):
+    """上游不可用且没有可用的缓存数据"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """令牌桶限流器"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: float = 0.0) -> bool:
+        """获取一个令牌，最多等待timeout秒"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """熔断器: closed -> open -> half_open -> closed"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """是否允许发起上游请求"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                # 半开状态只放行一个探测请求
+                self._probing = True
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        """熔断状态下距离允许探测还有多久(秒)"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def is_open(self) -> bool:
+        """是否处于熔断中且尚未到探测时间(不占用半开探测名额)"""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def release_probe(self):
+        """未实际发起请求时归还半开探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class UpstreamGuard:
+    """为单个上游函数提供限流、熔断、超时和stale-while-revalidate缓存"""
+
+    def __init__(self, name: str,
+                 rate: float = RATE_PER_SECOND,
+                 burst: int = BURST,
+                 call_timeout: float = CALL_TIMEOUT,
+                 failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT,
+                 fresh_ttl: float = FRESH_TTL,
+                 max_stale: float = MAX_STALE,
+                 max_entries: int = MAX_ENTRIES):
+        self.name = name
+        self.call_timeout = call_timeout
+        # 持有租约的worker最坏情况: 等待令牌 + 上游调用超时
+        self.lease_ttl = LIMIT_WAIT + call_timeout + LEASE_MARGIN
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.limiter = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._cache: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'fresh_hits': 0, 'stale_served': 0,
+                      'peer_hits': 0, 'failures': 0, 'errors': 0, 'timeouts': 0, 'throttled': 0, 'rejected': 0}
+
+    def _shared_key(self, key: Hashable) -> str:
+        return f"upstream:{self.name}:{key!r}"
+
+    def _get_cached(self, key: Hashable, fresh_ttl: Optional[float] = None) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+        if entry is not None and time.time() - entry[1] < (self.fresh_ttl if fresh_ttl is None else fresh_ttl):
+            return entry
+        # 本地没有或已过期时，看其他worker是否已经取到了更新的数据
+        shared = get_shared_cache()
+        if shared is None:
+            return entry
+        try:
+            updated_at = shared.get_updated_at(self._shared_key(key))
+            if updated_at is not None and (entry is None or updated_at > entry[1]):
+                shared_entry = shared.get(self._shared_key(key))
+                if shared_entry is not None:
+                    entry = shared_entry
+                    self._store_local(key, *entry)
+        except Exception as e:
+            print(f"[upstream] shared cache read {self.name} failed: {e}")
+        return entry
+
+    def _store_local(self, key: Hashable, value: Any, fetched_at: float):
+        with self._lock:
+            self._cache[key] = (value, fetched_at)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _store(self, key: Hashable, value: Any) -> float:
+        now = time.time()
+        self._store_local(key, value, now)
+        shared = get_shared_cache()
+        if shared is not None:
+            try:
+                shared.set(self._shared_key(key), value, now)
+            except Exception as e:
+                print(f"[upstream] shared cache write {self.name} failed: {e}")
+        return now
+
+    def _acquire_lease(self, key: Hashable) -> bool:
+        """跨worker的单飞锁，共享缓存不可用时总是成功"""
+        shared = get_shared_cache()
+        if shared is None:
+            return True
+        try:
+            return shared.acquire_lease(self._shared_key(key), self.lease_ttl)
+        except Exception as e:
+            print(f"[upstream] lease {self.name} failed: {e}")
+            return True
+
+    def _release_lease(self, key: Hashable):
+        shared = get_shared_cache()
+        if shared is not None:
+            try:
+                shared.release_lease(self._shared_key(key))
+            except Exception as e:
+                print(f"[upstream] lease release {self.name} failed: {e}")
+
+    def _lease_held(self, key: Hashable) -> bool:
+        shared = get_shared_cache()
+        if shared is None:
+            return False
+        try:
+            return shared.lease_held(self._shared_key(key))
+        except Exception as e:
+            print(f"[upstream] lease check {self.name} failed: {e}")
+            return False
+
+    def _wait_for_peer(self, key: Hashable, since: float, deadline: float) -> Optional[Tuple[Any, float]]:
+        """其他线程或worker正在请求同一数据时，等待其写入共享缓存
+
+        租约被释放(持有者请求失败)或到达deadline时返回None。
+        只在线程池中的请求线程上调用(路由为def)，轮询间隔逐步退避，不占用事件循环。
+        """
+        poll = LEASE_POLL
+        while time.monotonic() < deadline:
+            time.sleep(min(poll, max(0.0, deadline - time.monotonic())))
+            poll = min(poll * 2, LEASE_POLL_MAX)
+            entry = self._get_cached(key)
+            if entry is not None and entry[1] > since:
+                self.stats['peer_hits'] += 1
+                return entry
+            if not self._lease_held(key):
+                return None
+        return None
+
+    def _reject(self):
+        self.stats['rejected'] += 1
+        raise UpstreamUnavailable(f"{self.name}: circuit open", max(1.0, self.breaker.retry_after()))
+
+    def _invoke(self, key: Hashable, func: Callable, kwargs: Dict, timeout: Optional[float] = None) -> Tuple[Any, float]:
+        """在限流和熔断保护下调用上游，成功后写入缓存，返回(数据, 获取时间)
+
+        timeout小于call_timeout(等待其他worker后剩余的时间)时，超时不计入熔断。
+        """
+        timeout = self.call_timeout if timeout is None else timeout
+        if not self.breaker.allow():
+            self._reject()
+        if not self.limiter.acquire(LIMIT_WAIT):
+            self.stats['throttled'] += 1
+            # 限流不代表上游故障，归还可能占用的半开探测名额
+            self.breaker.release_probe()
+            raise UpstreamUnavailable(f"{self.name}: rate limited", 1.0)
+
+        self.stats['calls'] += 1
+        _upstream_calls.set(_upstream_calls.get() + 1)
+        future = _executor.submit(func, **kwargs)
+        try:
+            value = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self.stats['timeouts'] += 1
+            if timeout >= self.call_timeout:
+                self.breaker.record_failure()
+            else:
+                self.breaker.release_probe()
+            raise UpstreamUnavailable(f"{self.name}: timed out after {timeout:.1f}s", self.call_timeout)
+        except UPSTREAM_ERRORS:
+            self.stats['failures'] += 1
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            self.stats['errors'] += 1
+            self.breaker.release_probe()
+            raise
+        self.breaker.record_success()
+        return value, self._store(key, value)
+
+    def _revalidate(self, key: Hashable, func: Callable, kwargs: Dict):
+        try:
+            # 其他worker已在刷新时跳过
+            if self._acquire_lease(key):
+                try:
+                    self._invoke(key, func, kwargs)
+                finally:
+                    self._release_lease(key)
+        except Exception as e:
+            print(f"[upstream] revalidate {self.name} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _fetch(self, key: Hashable, func: Callable, kwargs: Dict) -> Tuple[Any, float]:
+        """请求上游，其他线程或worker正在请求同一数据时等待其结果
+
+        持有者释放租约却没有写入新数据(请求失败)时，在剩余时间内自己请求一次；
+        总耗时不超过lease_ttl。
+        """
+        if self.breaker.is_open():
+            self._reject()
+        deadline = time.monotonic() + self.lease_ttl
+        requested_at = time.time()
+        while True:
+            if self._acquire_lease(key):
+                try:
+                    timeout = min(self.call_timeout, deadline - time.monotonic() - LIMIT_WAIT)
+                    if timeout <= 0:
+                        break
+                    return self._invoke(key, func, kwargs, timeout)
+                finally:
+                    self._release_lease(key)
+            peer_entry = self._wait_for_peer(key, requested_at, deadline)
+            if peer_entry is not None:
+                return peer_entry
+            if time.monotonic() >= deadline:
+                break
+            # 持有者的失败可能已经触发熔断
+            if self.breaker.is_open():
+                self._reject()
+        raise UpstreamUnavailable(f"{self.name}: timed out waiting for another worker", 1.0)
+
+    def call_entry(self, func: Callable, max_age: Optional[float] = None, **kwargs) -> Tuple[Any, float]:
+        """返回(数据, 获取时间戳)
+
+        指定max_age时(定时刷新)不返回更旧的缓存，也不走过期数据后台刷新，而是同步请求上游。
+        """
+        key = tuple(sorted(kwargs.items()))
+        entry = self._get_cached(key, max_age)
+        if entry is not None:
+            age = time.time() - entry[1]
+            if age < (self.fresh_ttl if max_age is None else max_age):
+                self.stats['fresh_hits'] += 1
+                return entry
+            if max_age is None and age < self.max_stale:
+                # 先返回旧数据，后台刷新
+                with self._lock:
+                    start = key not in self._refreshing
+                    self._refreshing.add(key)
+                if start:
+                    _refresh_executor.submit(self._revalidate, key, func, kwargs)
+                self.stats['stale_served'] += 1
+                mark_stale(age)
+                return entry
+        return self._fetch(key, func, kwargs)
+
+    def call(self, func: Callable, **kwargs) -> Any:
+        return self.call_entry(func, **kwargs)[0]
+
+    def snapshot(self) -> Dict:
+        return {
+            'state': self.breaker.state,
+            'cached': len(self._cache),
+            **self.stats,
+        }
+
+
+_guards: Dict[str, UpstreamGuard] = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(name: str, **options) -> UpstreamGuard:
+    """获取(或创建)某个上游函数的保护器，options仅在首次创建时生效"""
+    with _guards_lock:
+        guard = _guards.get(name)
+        if guard is None:
+            guard = _guards[name] = UpstreamGuard(name, **options)
+        return guard
+
+
+def get_upstream_stats() -> Dict:
+    """获取所有上游函数的状态"""
+    with _guards_lock:
+        return {name: guard.snapshot() for name, guard in _guards.items()}
@@ -0,0 +1,247 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# 同一主机上所有worker共享的缓存文件，默认放在backend目录下，可用环境变量SHARED_CACHE_PATH指定
+SHARED_CACHE_PATH = os.environ.get('SHARED_CACHE_PATH') or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'shared_cache.db')
+COMPRESS_LEVEL = 1           # zlib压缩级别，优先速度
+PURGE_AFTER = 24 * 3600.0    # 超过该时间未更新的缓存会被清理(秒)
+PURGE_EVERY = 500            # 每写入多少次执行一次清理
+SETTINGS_TTL = 30 * 86400.0  # 超过该时间未更新的设置(多为已结束的部署)会被清理(秒)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def _process_start_time(pid: int) -> str:
+    """进程启动时间(Linux下读取/proc)，用于区分复用的pid"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        return ''
+
+
+def deployment_id() -> str:
+    """当前部署的标识: 同一个uvicorn主进程下的worker相同，重启后改变
+
+    多worker时取主进程(multiprocessing父进程)，单进程时取自身；可用环境变量DEPLOYMENT_ID覆盖。
+    """
+    configured = os.environ.get('DEPLOYMENT_ID')
+    if configured:
+        return configured
+    parent = multiprocessing.parent_process()
+    pid = parent.pid if parent is not None else os.getpid()
+    return f"{pid}:{_process_start_time(pid)}"
+
+
+def _is_frame(value: Any) -> bool:
+    cls = type(value)
+    return cls.__name__ == 'DataFrame' and cls.__module__.startswith('pandas')
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        # numpy标量
+        return value.item()
+    return str(value)
+
+
+def _encode_column(series) -> Tuple[str, List]:
+    import pandas as pd
+
+    dtype = str(series.dtype)
+    if dtype.startswith('datetime64'):
+        return 'datetime', [None if pd.isna(v) else v.isoformat() for v in series]
+    values = series.tolist()
+    non_null = [v for v in values if v is not None and not (isinstance(v, float) and v != v)]
+    if dtype == 'object' and non_null and all(isinstance(v, date) and not isinstance(v, datetime) for v in non_null):
+        return 'date', [v.isoformat() if isinstance(v, date) else None for v in values]
+    return dtype, values
+
+
+def _decode_column(kind: str, values: List):
+    import pandas as pd
+
+    if kind == 'datetime':
+        return pd.to_datetime(pd.Series(values, dtype=object))
+    if kind == 'date':
+        return pd.Series([date.fromisoformat(v) if v else None for v in values], dtype=object)
+    if kind == 'object':
+        return pd.Series(values, dtype=object)
+    try:
+        return pd.Series(values).astype(kind)
+    except (TypeError, ValueError):
+        return pd.Series(values, dtype=object)
+
+
+def _frame_to_dict(frame) -> Dict:
+    import pandas as pd
+
+    kinds, columns = [], []
+    for position in range(frame.shape[1]):
+        kind, values = _encode_column(frame.iloc[:, position])
+        kinds.append(kind)
+        columns.append(values)
+    index = None if isinstance(frame.index, pd.RangeIndex) else frame.index.tolist()
+    return {'names': list(frame.columns), 'kinds': kinds, 'columns': columns, 'index': index}
+
+
+def _frame_from_dict(data: Dict):
+    import pandas as pd
+
+    frame = pd.DataFrame({
+        position: _decode_column(kind, values)
+        for position, (kind, values) in enumerate(zip(data['kinds'], data['columns']))
+    })
+    frame.columns = data['names']
+    if data['index'] is not None:
+        frame.index = data['index']
+    return frame
+
+
+def dumps(value: Any) -> bytes:
+    """将基金数据/DataFrame序列化为压缩的JSON(不使用pickle，读取时不会执行代码)"""
+    if _is_frame(value):
+        payload = {'type': 'frame', 'data': _frame_to_dict(value)}
+    else:
+        payload = {'type': 'json', 'data': value}
+    text = json.dumps(payload, ensure_ascii=False, default=_json_default)
+    return zlib.compress(text.encode('utf-8'), COMPRESS_LEVEL)
+
+
+def loads(data: bytes) -> Any:
+    payload = json.loads(zlib.decompress(data).decode('utf-8'))
+    if payload['type'] == 'frame':
+        return _frame_from_dict(payload['data'])
+    return payload['data']
+
+
+class SharedCache:
+    """基于SQLite(WAL)的跨进程缓存和共享状态"""
+
+    def __init__(self, path: str = SHARED_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._connect().executescript(_SCHEMA)
+        try:
+            # 缓存只供本机同一用户的worker使用
+            os.chmod(self.path, 0o600)
+        except OSError:
+            pass
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """返回(值, 写入时间戳)，不存在时返回None"""
+        row = self._connect().execute("SELECT value, updated_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return loads(row[0]), row[1]
+
+    def get_updated_at(self, key: str) -> Optional[float]:
+        row = self._connect().execute("SELECT updated_at FROM cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: Any, updated_at: float = None):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, updated_at) VALUES (?, ?, ?)",
+            (key, dumps(value), updated_at or time.time())
+        )
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            self.purge()
+
+    def purge(self, older_than: float = PURGE_AFTER):
+        """清理过旧的缓存和过期的租约"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("DELETE FROM cache WHERE updated_at < ?", (now - older_than,))
+        conn.execute("DELETE FROM leases WHERE expires_at < ?", (now,))
+        conn.execute("DELETE FROM settings WHERE updated_at < ?", (now - SETTINGS_TTL,))
+
+    def get_setting(self, name: str) -> Optional[str]:
+        row = self._connect().execute("SELECT value FROM settings WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_setting(self, name: str, value: str):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO settings (name, value, updated_at) VALUES (?, ?, ?)",
+            (name, value, time.time())
+        )
+
+    def acquire_lease(self, key: str, ttl: float) -> bool:
+        """获取跨进程租约，保证同一时间只有一个worker请求上游"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires_at < ?", (key, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO leases (key, expires_at) VALUES (?, ?)", (key, now + ttl))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def release_lease(self, key: str):
+        self._connect().execute("DELETE FROM leases WHERE key = ?", (key,))
+
+    def lease_held(self, key: str) -> bool:
+        """租约是否仍被持有(未释放且未过期)"""
+        row = self._connect().execute(
+            "SELECT 1 FROM leases WHERE key = ? AND expires_at >= ?", (key, time.time())).fetchone()
+        return row is not None
+
+
+_shared_cache: Optional[SharedCache] = None
+_shared_cache_disabled = False
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """获取共享缓存，未配置或无法打开时返回None(退化为进程内缓存)"""
+    global _shared_cache, _shared_cache_disabled
+    if _shared_cache is None and not _shared_cache_disabled:
+        with _shared_cache_lock:
+            if _shared_cache is None and not _shared_cache_disabled:
+                try:
+                    if not SHARED_CACHE_PATH:
+                        raise sqlite3.Error("SHARED_CACHE_PATH not set")
+                    _shared_cache = SharedCache(SHARED_CACHE_PATH)
+                except sqlite3.Error as e:
+                    print(f"[shared_cache] disabled: {e}")
+                    _shared_cache_disabled = True
+    return _shared_cache
@@ -1,23 +1,37 @@
 from fastapi import APIRouter
 from typing import Dict
 from data_sources import DataSourceManager
+from data_sources.resilience import get_upstream_stats
 
 router = APIRouter()
 
+# 读写数据源选择会访问共享存储(SQLite)，这些路由使用def，由FastAPI放到线程池执行
+
 @router.get("/")
 async def get_available_sources() -> Dict:
     """获取所有可用数据源"""
     return DataSourceManager.get_available_sources()
 
 @router.get("/current")
-async def get_current_source() -> Dict:
+def get_current_source() -> Dict:
     """获取当前数据源"""
     return {
         'current_source': DataSourceManager.get_source_name()
     }
 
+@router.get("/upstream")
+async def get_upstream_status() -> Dict:
+    """获取上游接口的限流/熔断/缓存状态"""
+    return get_upstream_stats()
+
+@router.get("/nav_snapshot")
+def get_nav_snapshot_status() -> Dict:
+    """获取全市场净值表的拉取状态和耗时"""
+    from data_sources.akshare import AkShareDataSource
+    return AkShareDataSource.get_nav_store().stats
+
 @router.post("/set/{source_name}")
-async def set_source(source_name: str) -> Dict:
+def set_source(source_name: str) -> Dict:
     """切换数据源"""
     try:
         DataSourceManager.set_source(source_name)
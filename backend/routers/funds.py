@@ -1,45 +1,72 @@
-from fastapi import APIRouter, Query
-from typing import List, Dict, Optional
+import math
+from fastapi import APIRouter, HTTPException, Query, Response, status
+from typing import Any, List, Dict, Optional
 from data_sources import DataSourceManager
+from data_sources.resilience import reset_stale, get_stale_age, UpstreamUnavailable
 
 router = APIRouter()
 
+STALE_HEADER = "X-Data-Stale"
+MAX_BATCH_CODES = 500
+
+# 数据源调用是同步阻塞的(限流、上游请求)，路由使用def，由FastAPI放到线程池执行，不阻塞事件循环
+
+def _query_source(response: Response, method: str, *args) -> Any:
+    """调用当前数据源；返回了缓存数据时设置过期响应头，上游不可用时返回503"""
+    reset_stale()
+    source = DataSourceManager.get_source()
+    try:
+        result = getattr(source, method)(*args)
+    except UpstreamUnavailable as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"数据源暂时不可用: {e}",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    age = get_stale_age()
+    if age is not None:
+        response.headers[STALE_HEADER] = str(int(age))
+    return result
+
 @router.get("/search")
-async def search_funds(keyword: str, limit: int = Query(20, ge=1, le=100)) -> List[Dict]:
+def search_funds(response: Response, keyword: str, limit: int = Query(20, ge=1, le=100)) -> List[Dict]:
     """搜索基金"""
-    source = DataSourceManager.get_source()
-    return source.search_funds(keyword, limit)
+    return _query_source(response, 'search_funds', keyword, limit)
+
+@router.get("/estimates")
+def get_fund_estimates(response: Response, codes: str = Query(..., description="逗号分隔的基金代码")) -> Dict[str, Dict]:
+    """批量获取基金实时估值"""
+    fund_codes = list(dict.fromkeys(code.strip() for code in codes.split(',') if code.strip()))
+    if len(fund_codes) > MAX_BATCH_CODES:
+        raise HTTPException(status_code=400, detail=f"一次最多查询 {MAX_BATCH_CODES} 只基金")
+    return _query_source(response, 'get_fund_estimates', fund_codes)
 
 @router.get("/{fund_code}/detail")
-async def get_fund_detail(fund_code: str) -> Dict:
+def get_fund_detail(fund_code: str, response: Response) -> Dict:
     """获取基金详情"""
-    source = DataSourceManager.get_source()
-    return source.get_fund_detail(fund_code)
+    return _query_source(response, 'get_fund_detail', fund_code)
 
 @router.get("/{fund_code}/estimate")
-async def get_fund_estimate(fund_code: str) -> Dict:
+def get_fund_estimate(fund_code: str, response: Response) -> Dict:
     """获取基金实时估值"""
-    source = DataSourceManager.get_source()
-    return source.get_fund_estimate(fund_code)
+    return _query_source(response, 'get_fund_estimate', fund_code)
 
 @router.get("/{fund_code}/history")
-async def get_fund_history(
+def get_fund_history(
     fund_code: str,
+    response: Response,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None
 ) -> List[Dict]:
     """获取基金历史净值"""
-    source = DataSourceManager.get_source()
-    return source.get_fund_history(fund_code, start_date, end_date)
+    return _query_source(response, 'get_fund_history', fund_code, start_date, end_date)
 
 @router.get("/{fund_code}/holdings")
-async def get_fund_holdings(fund_code: str) -> List[Dict]:
+def get_fund_holdings(fund_code: str, response: Response) -> List[Dict]:
     """获取基金重仓股"""
-    source = DataSourceManager.get_source()
-    return source.get_fund_holdings(fund_code)
+    return _query_source(response, 'get_fund_holdings', fund_code)
 
 @router.get("/{fund_code}/managers")
-async def get_fund_managers(fund_code: str) -> List[Dict]:
+def get_fund_managers(fund_code: str, response: Response) -> List[Dict]:
     """获取基金经理信息"""
-    source = DataSourceManager.get_source()
-    return source.get_fund_managers(fund_code)
\ No newline at end of file
+    return _query_source(response, 'get_fund_managers', fund_code)
@@ -0,0 +1,127 @@
+import importlib
+import sys
+import threading
+import types
+
+import pandas as pd
+import pytest
+
+from data_sources import resilience
+from data_sources.resilience import UpstreamUnavailable
+
+BASIC_INFO = pd.DataFrame({
+    'item': ['基金代码', '基金名称', '基金全称', '基金类型'],
+    'value': ['110011', '易方达优质精选', '易方达优质精选混合型证券投资基金', '混合型'],
+})
+
+
+@pytest.fixture
+def ak(monkeypatch):
+    """用空的akshare模块替代真实依赖，各测试按需设置上游函数"""
+    stub = types.ModuleType("akshare")
+    monkeypatch.setitem(sys.modules, "akshare", stub)
+    monkeypatch.setattr(resilience, "get_shared_cache", lambda: None)
+    monkeypatch.setattr(resilience, "_guards", {})
+    module = importlib.import_module("data_sources.akshare")
+    monkeypatch.setattr(module, "ak", stub)
+    return stub
+
+
+def source():
+    from data_sources.akshare import AkShareDataSource
+    return AkShareDataSource()
+
+
+def test_search_by_code_survives_non_etf_errors(ak):
+    ak.fund_individual_basic_info_xq = lambda symbol: BASIC_INFO
+
+    def not_an_etf(symbol):
+        raise KeyError("基金简称")
+
+    ak.fund_etf_fund_info_em = not_an_etf
+    for _ in range(10):
+        results = source().search_funds('110011')
+        assert [item['code'] for item in results] == ['110011']
+
+
+def test_search_keeps_results_when_secondary_endpoint_unavailable(ak, monkeypatch):
+    ak.fund_individual_basic_info_xq = lambda symbol: BASIC_INFO
+    ak.fund_etf_fund_info_em = lambda symbol: pd.DataFrame()
+    monkeypatch.setattr(resilience.get_guard('fund_etf_fund_info_em').breaker, "allow", lambda: False)
+
+    assert [item['code'] for item in source().search_funds('110011')] == ['110011']
+
+
+def test_search_raises_when_nothing_found_and_endpoint_unavailable(ak, monkeypatch):
+    ak.fund_individual_basic_info_xq = lambda symbol: pd.DataFrame()
+    ak.fund_etf_fund_info_em = lambda symbol: pd.DataFrame()
+    monkeypatch.setattr(resilience.get_guard('fund_etf_fund_info_em').breaker, "allow", lambda: False)
+
+    with pytest.raises(UpstreamUnavailable):
+        source().search_funds('110011')
+
+
+def test_unknown_codes_do_not_open_detail_breaker(ak):
+    def basic_info(symbol):
+        if symbol != '110011':
+            raise KeyError("data")
+        return BASIC_INFO
+
+    ak.fund_individual_basic_info_xq = basic_info
+    for code in ['000000', '000001', '000002', '000003', '000004', '000005']:
+        assert source().get_fund_detail(code) == {}
+    assert source().get_fund_detail('110011')['name'] == '易方达优质精选'
+
+
+def test_nav_store_is_created_once_under_concurrency(ak, monkeypatch):
+    from data_sources.akshare import AkShareDataSource
+
+    monkeypatch.setattr(AkShareDataSource, "_nav_store", None)
+    barrier = threading.Barrier(8)
+    stores = []
+
+    def get():
+        barrier.wait()
+        stores.append(AkShareDataSource.get_nav_store())
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(store) for store in stores}) == 1
+
+
+def test_em_source_searches_whole_market_list(ak):
+    from data_sources.akshare_em import AkShareEmDataSource
+
+    ak.fund_name_em = lambda: pd.DataFrame({
+        '基金代码': ['110011', '161725'],
+        '拼音缩写': ['YFDYZJX', 'ZSZZBJ'],
+        '基金简称': ['易方达优质精选', '招商中证白酒'],
+        '基金类型': ['混合型', '指数型'],
+    })
+    source = AkShareEmDataSource()
+    assert [item['code'] for item in source.search_funds('白酒')] == ['161725']
+    assert [item['code'] for item in source.search_funds('110011')] == ['110011']
+    assert [item['code'] for item in source.search_funds('yfd')] == ['110011']
+
+
+def test_em_source_history_comes_from_nav_tables(ak, monkeypatch):
+    from data_sources.akshare import AkShareDataSource
+    from data_sources.akshare_em import AkShareEmDataSource
+    from data_sources.nav_snapshot import NavSnapshotStore, normalize
+
+    raw = pd.DataFrame({
+        '基金代码': ['110011'], '基金简称': ['易方达优质精选'],
+        '2024-05-07-单位净值': [2.0], '2024-05-07-累计净值': [3.0],
+        '2024-05-06-单位净值': [1.9], '2024-05-06-累计净值': [2.9], '日增长率': ['5.26'],
+    })
+    store = NavSnapshotStore(lambda func_name, max_age: (raw, None))
+    store.current = normalize(raw)
+    monkeypatch.setattr(store, "start", lambda: None)
+    monkeypatch.setattr(AkShareDataSource, "_nav_store", store)
+
+    history = AkShareEmDataSource().get_fund_history('110011')
+    assert [item['date'] for item in history] == ['2024-05-07']
+    assert AkShareEmDataSource().get_fund_history('110011', start_date='2024-05-08') == []
@@ -0,0 +1,34 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+
+client = TestClient(app_module.app)
+
+
+@pytest.fixture
+def state(monkeypatch):
+    fresh = {'ready': False, 'startup_seconds': 0.1, 'warmup_seconds': None, 'warmup_error': None}
+    monkeypatch.setattr(app_module, "startup_state", fresh)
+    monkeypatch.setattr(app_module, "WARMUP_RETRY", 0.0)
+    return fresh
+
+
+def test_ready_returns_503_until_warm_up_succeeds(state, monkeypatch):
+    checks = []
+
+    def warm_up():
+        # 第一次失败；重试时预热错误仍在，就绪检查应返回503
+        checks.append(client.get("/ready"))
+        if len(checks) == 1:
+            raise ImportError("No module named 'akshare'")
+
+    monkeypatch.setattr(app_module.DataSourceManager, "warm_up", warm_up)
+    app_module._warm_up()
+
+    assert checks[0].json()['status'] == "starting"
+    assert checks[1].status_code == 503
+    assert checks[1].json()['status'] == "warmup_failed"
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()['warmup_error'] is None
@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+from data_sources import composite, resilience
+from data_sources.base import BaseDataSource
+from data_sources.composite import CompositeDataSource
+from data_sources.mock import MockDataSource
+from data_sources.resilience import UpstreamUnavailable
+
+
+class FakeSource(BaseDataSource):
+    """按构造参数返回结果、抛出异常或延迟的假数据源"""
+
+    def __init__(self, detail=None, error=None, delay=0.0):
+        self.detail = detail
+        self.error = error
+        self.delay = delay
+
+    def get_fund_detail(self, fund_code):
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.detail
+
+    search_funds = get_fund_estimate = get_fund_history = None
+    get_fund_holdings = get_fund_managers = None
+
+
+def test_rejects_mock_backend():
+    with pytest.raises(ValueError):
+        CompositeDataSource([('real', FakeSource({'code': '1'})), ('mock', MockDataSource())])
+
+
+def test_fails_over_on_error():
+    source = CompositeDataSource([
+        ('primary', FakeSource(error=RuntimeError('boom'))),
+        ('secondary', FakeSource({'code': '1', 'from': 'secondary'})),
+    ])
+    assert source.get_fund_detail('1')['from'] == 'secondary'
+
+
+def test_hedges_slow_primary(monkeypatch):
+    monkeypatch.setattr(composite, 'HEDGE_DELAY', 0.05)
+    source = CompositeDataSource([
+        ('primary', FakeSource({'from': 'primary'}, delay=0.5)),
+        ('secondary', FakeSource({'from': 'secondary'})),
+    ])
+    start = time.monotonic()
+    assert source.get_fund_detail('1')['from'] == 'secondary'
+    assert time.monotonic() - start < 0.4
+
+
+def test_raises_when_all_backends_unavailable():
+    source = CompositeDataSource([
+        ('primary', FakeSource(error=UpstreamUnavailable('down', 5.0))),
+        ('secondary', FakeSource(error=UpstreamUnavailable('down', 5.0))),
+    ])
+    with pytest.raises(UpstreamUnavailable):
+        source.get_fund_detail('1')
+
+
+class GuardedSource(FakeSource):
+    """经过UpstreamGuard取数的假数据源，第二次查询同一基金命中缓存"""
+
+    def __init__(self):
+        super().__init__()
+        self.guard = resilience.UpstreamGuard("detail")
+
+    def get_fund_detail(self, fund_code):
+        return self.guard.call(lambda symbol: {'code': symbol}, symbol=fund_code)
+
+
+def test_records_latency_only_for_upstream_calls(monkeypatch):
+    monkeypatch.setattr(resilience, "get_shared_cache", lambda: None)
+    source = CompositeDataSource([('primary', GuardedSource()), ('secondary', FakeSource({'code': '1'}))])
+    for _ in range(5):
+        assert source.get_fund_detail('1') == {'code': '1'}
+    # 只有第一次请求了上游，之后的缓存命中不计入p95
+    assert len(source._window('primary', 'get_fund_detail')._samples) == 1
+
+
+def test_backend_only_receives_declared_methods():
+    partial = FakeSource(error=AssertionError('should not be called'))
+    partial.METHODS = ('search_funds',)
+    source = CompositeDataSource([('primary', FakeSource({'from': 'primary'})), ('partial', partial)])
+    assert source._backends_for('get_fund_detail') == [source.backends[0]]
+    assert source.get_fund_detail('1')['from'] == 'primary'
+
+
+def test_failover_only_backend_is_not_hedged(monkeypatch):
+    monkeypatch.setattr(composite, 'HEDGE_DELAY', 0.05)
+    secondary = FakeSource({'from': 'secondary'})
+    secondary.FAILOVER_ONLY = ('get_fund_detail',)
+    source = CompositeDataSource([('primary', FakeSource({'from': 'primary'}, delay=0.3)), ('secondary', secondary)])
+    assert source.get_fund_detail('1')['from'] == 'primary'
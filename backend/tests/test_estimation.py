@@ -0,0 +1,113 @@
+import time
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+from data_sources import estimation
+from data_sources.resilience import UpstreamUnavailable
+from data_sources.estimation import MARKET_TZ, EstimationEngine, HOLDINGS_FUNC, QUOTE_FUNC, CALENDAR_FUNC
+
+SPOT = pd.DataFrame({'代码': ['600519', '000001'], '涨跌幅': [2.0, -1.0],
+                     '最新价': [1500.0, 10.0], '今开': [1480.0, 10.1], '成交量': [1000, 2000]})
+HOLDINGS = pd.DataFrame({'股票代码': ['600519', '000001'], '占净值比例': [10.0, 5.0], '季度': ['2024Q1', '2024Q1']})
+
+
+class FakeUpstream:
+    """记录上游调用次数，行情的获取时间由测试指定"""
+
+    def __init__(self, fetched_at):
+        self.fetched_at = fetched_at
+        self.calls = []
+
+    def call(self, func_name, **kwargs):
+        self.calls.append(func_name)
+        if func_name == CALENDAR_FUNC:
+            return pd.DataFrame({'trade_date': [date(2024, 5, 6), date(2024, 5, 7)]})
+        if func_name == HOLDINGS_FUNC:
+            return HOLDINGS
+        raise AssertionError(func_name)
+
+    def fetch(self, func_name, max_age, **kwargs):
+        assert func_name == QUOTE_FUNC
+        self.calls.append(func_name)
+        return SPOT, self.fetched_at
+
+
+def make_engine(monkeypatch, now):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now
+
+    monkeypatch.setattr(estimation, "datetime", FrozenDatetime)
+    upstream = FakeUpstream(now)
+    engine = EstimationEngine(upstream.call, upstream.fetch)
+    monkeypatch.setattr(engine, "_ensure_timer", lambda: None)
+    return engine, upstream
+
+
+def test_no_estimate_outside_trading_session(monkeypatch):
+    # 2024-05-05是周日，日历中没有
+    engine, upstream = make_engine(monkeypatch, datetime(2024, 5, 5, 10, 0, tzinfo=MARKET_TZ))
+    assert engine.estimate_changes(['110011'], wait=True) == ({}, None)
+    assert QUOTE_FUNC not in upstream.calls
+
+
+def test_no_estimate_before_open(monkeypatch):
+    engine, upstream = make_engine(monkeypatch, datetime(2024, 5, 6, 9, 0, tzinfo=MARKET_TZ))
+    assert engine.estimate_changes(['110011'], wait=True) == ({}, None)
+    assert QUOTE_FUNC not in upstream.calls
+
+
+def test_estimate_during_session(monkeypatch):
+    engine, _ = make_engine(monkeypatch, datetime(2024, 5, 6, 10, 0, tzinfo=MARKET_TZ))
+    changes, snapshot = engine.estimate_changes(['110011'], wait=True)
+    assert changes['110011'] == pytest.approx(10.0 * 2.0 / 100 + 5.0 * -1.0 / 100)
+    assert snapshot.session_date == date(2024, 5, 6)
+
+
+def test_batch_does_not_fetch_holdings_on_request_path(monkeypatch):
+    engine, upstream = make_engine(monkeypatch, datetime(2024, 5, 6, 10, 0, tzinfo=MARKET_TZ))
+    queued = []
+    monkeypatch.setattr(engine, "_queue_weights", queued.extend)
+    changes, snapshot = engine.estimate_changes(['110011', '110022'])
+    assert changes == {}
+    assert snapshot is not None
+    assert queued == ['110011', '110022']
+    assert HOLDINGS_FUNC not in upstream.calls
+
+
+def test_holdings_use_current_year_then_previous(monkeypatch):
+    now = datetime(2024, 2, 1, 10, 0, tzinfo=MARKET_TZ)
+    engine, _ = make_engine(monkeypatch, now)
+    requests = []
+
+    def call(func_name, **kwargs):
+        requests.append(kwargs)
+        return HOLDINGS if kwargs['date'] == '2023' else pd.DataFrame()
+
+    engine._call = call
+    assert engine.get_weights('110011').to_dict() == {'000001': 5.0, '600519': 10.0}
+    assert requests == [{'symbol': '110011', 'date': '2024'}, {'symbol': '110011', 'date': '2023'}]
+
+
+def test_loader_does_not_block_on_unavailable_fund(monkeypatch):
+    engine, _ = make_engine(monkeypatch, datetime(2024, 5, 6, 10, 0, tzinfo=MARKET_TZ))
+
+    def call(func_name, symbol, date):
+        if symbol == 'bad':
+            raise UpstreamUnavailable("fund_portfolio_hold_em: timed out", 0.0)
+        return HOLDINGS
+
+    engine._call = call
+    engine._queue_weights(['bad', 'good'])
+    deadline = time.monotonic() + 2.0
+    while engine._loader is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert engine._loader is None
+    assert not engine._queue
+    assert not engine._weights['good'][0].empty
+    # 失败的基金推迟到HOLDINGS_RETRY之后再加载
+    assert engine._weights['bad'][0].empty
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+import pandas as pd
+
+from data_sources.nav_snapshot import NavSnapshotStore, NAV_FUNC, NAV_RETRY
+
+RAW = pd.DataFrame({
+    '基金代码': ['110011', '161725'],
+    '基金简称': ['易方达优质精选', '招商中证白酒'],
+    '2024-05-07-单位净值': [2.0, None],
+    '2024-05-07-累计净值': [3.0, None],
+    '2024-05-06-单位净值': [1.9, 1.0],
+    '2024-05-06-累计净值': [2.9, 2.0],
+    '日增长率': ['', ''],
+})
+
+
+def test_refresh_forces_fetch_and_keeps_real_fetch_time():
+    fetched_at = datetime(2024, 5, 7, 21, 0)
+    requests = []
+
+    def fetch(func_name, max_age, **kwargs):
+        requests.append((func_name, max_age))
+        return RAW, fetched_at
+
+    store = NavSnapshotStore(fetch)
+    assert store.refresh()
+    assert requests == [(NAV_FUNC, NAV_RETRY)]
+    assert store.current.ingested_at == fetched_at
+    assert store.current.get('110011')['change_pct'] == 5.26
+    # 当日未公布的基金沿用上一日净值
+    assert store.current.get('161725')['nav_date'] == '2024-05-06'
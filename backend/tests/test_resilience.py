@@ -0,0 +1,243 @@
+import threading
+import time as real_time
+
+import pytest
+
+from data_sources import resilience
+from data_sources.shared_cache import SharedCache
+from data_sources.resilience import (
+    CircuitBreaker,
+    TokenBucket,
+    UpstreamGuard,
+    UpstreamUnavailable,
+)
+
+
+class FakeTime:
+    """可手动推进的时钟，替换resilience模块中的time"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(resilience, "time", fake)
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def no_shared_cache(monkeypatch):
+    monkeypatch.setattr(resilience, "get_shared_cache", lambda: None)
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = real_time.monotonic() + timeout
+    while not predicate():
+        if real_time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        real_time.sleep(0.01)
+
+
+def test_token_bucket_fails_fast_when_empty(clock):
+    bucket = TokenBucket(rate=1.0, capacity=2)
+    assert bucket.acquire()
+    assert bucket.acquire()
+    assert not bucket.acquire(0.0)
+    clock.advance(1.0)
+    assert bucket.acquire()
+
+
+def test_token_bucket_waits_only_within_timeout(clock):
+    bucket = TokenBucket(rate=2.0, capacity=1)
+    assert bucket.acquire()
+    # 下一个令牌需要0.5秒，超过等待上限时立即失败
+    assert not bucket.acquire(0.2)
+    assert bucket.acquire(0.6)
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10.0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == pytest.approx(10.0)
+
+
+def test_breaker_half_open_allows_single_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0)
+    breaker.record_failure()
+    clock.advance(10.0)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.release_probe()
+    assert breaker.allow()
+
+
+def test_breaker_probe_result_closes_or_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10.0)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.advance(10.0)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.advance(10.0)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_guard_serves_fresh_cache_without_calling(clock):
+    calls = []
+    guard = UpstreamGuard("f", fresh_ttl=60.0)
+
+    def func(symbol):
+        calls.append(symbol)
+        return {"v": symbol}
+
+    assert guard.call(func, symbol="a") == {"v": "a"}
+    clock.advance(30.0)
+    assert guard.call(func, symbol="a") == {"v": "a"}
+    assert calls == ["a"]
+
+
+def test_guard_serves_stale_and_revalidates(clock):
+    calls = []
+    guard = UpstreamGuard("f", fresh_ttl=60.0, max_stale=3600.0)
+
+    def func(symbol):
+        calls.append(symbol)
+        return len(calls)
+
+    assert guard.call(func, symbol="a") == 1
+    clock.advance(120.0)
+    resilience.reset_stale()
+    assert guard.call(func, symbol="a") == 1
+    assert resilience.get_stale_age() == pytest.approx(120.0)
+    wait_until(lambda: len(calls) == 2)
+    wait_until(lambda: guard.call(func, symbol="a") == 2)
+
+
+def test_guard_max_age_bypasses_stale_while_revalidate(clock):
+    calls = []
+    guard = UpstreamGuard("f", fresh_ttl=60.0)
+
+    def func():
+        calls.append(1)
+        return len(calls)
+
+    assert guard.call(func) == 1
+    clock.advance(20.0)
+    assert guard.call_entry(func, max_age=30.0) == (1, clock.now - 20.0)
+    clock.advance(20.0)
+    value, fetched_at = guard.call_entry(func, max_age=30.0)
+    assert value == 2
+    assert fetched_at == clock.now
+
+
+def test_guard_raises_when_circuit_open_and_nothing_cached(clock):
+    guard = UpstreamGuard("f", failure_threshold=1, reset_timeout=30.0)
+
+    def broken(symbol):
+        raise ConnectionError("upstream down")
+
+    with pytest.raises(ConnectionError):
+        guard.call(broken, symbol="a")
+    with pytest.raises(UpstreamUnavailable) as excinfo:
+        guard.call(broken, symbol="b")
+    assert excinfo.value.retry_after == pytest.approx(30.0)
+    assert guard.stats["rejected"] == 1
+
+
+def test_guard_request_errors_do_not_trip_breaker(clock):
+    guard = UpstreamGuard("f", failure_threshold=2)
+
+    def unknown_code(symbol):
+        raise KeyError("data")
+
+    for symbol in "abcdef":
+        with pytest.raises(KeyError):
+            guard.call(unknown_code, symbol=symbol)
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+    assert guard.stats["errors"] == 6
+    assert guard.stats["failures"] == 0
+
+
+def test_guard_throttles_without_tripping_breaker(clock):
+    guard = UpstreamGuard("f", rate=1.0, burst=1)
+
+    def func(symbol):
+        return symbol
+
+    assert guard.call(func, symbol="a") == "a"
+    with pytest.raises(UpstreamUnavailable):
+        guard.call(func, symbol="b")
+    assert guard.stats["throttled"] == 1
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_guard_timeout_counts_as_failure():
+    guard = UpstreamGuard("f", call_timeout=0.05, failure_threshold=1)
+
+    def slow():
+        real_time.sleep(0.5)
+
+    with pytest.raises(UpstreamUnavailable):
+        guard.call(slow)
+    assert guard.stats["timeouts"] == 1
+    assert guard.breaker.state == CircuitBreaker.OPEN
+
+
+def test_waiter_stops_when_lease_holder_fails(monkeypatch, tmp_path):
+    shared = SharedCache(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(resilience, "get_shared_cache", lambda: shared)
+    guard = UpstreamGuard("f", call_timeout=8.0)
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        real_time.sleep(0.2)
+        raise KeyError("data")
+
+    holder = threading.Thread(target=lambda: pytest.raises(KeyError, guard.call, failing))
+    holder.start()
+    started.wait(1.0)
+    begin = real_time.monotonic()
+    with pytest.raises(KeyError):
+        guard.call(failing)
+    holder.join()
+    # 持有者失败后不再等满lease_ttl(9.2s)，而是很快自己请求一次
+    assert real_time.monotonic() - begin < 2.0
+
+
+def test_open_breaker_rejects_without_waiting_for_lease(monkeypatch, tmp_path):
+    shared = SharedCache(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(resilience, "get_shared_cache", lambda: shared)
+    guard = UpstreamGuard("f", failure_threshold=1)
+    guard.breaker.record_failure()
+    shared.acquire_lease(guard._shared_key(()), 60.0)
+
+    begin = real_time.monotonic()
+    with pytest.raises(UpstreamUnavailable):
+        guard.call(lambda: 1)
+    assert real_time.monotonic() - begin < 0.5
+    assert guard.stats["rejected"] == 1
@@ -0,0 +1,35 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from data_sources.shared_cache import SharedCache, dumps, loads
+
+
+def test_dataframe_round_trip_keeps_dtypes():
+    frame = pd.DataFrame({
+        '净值日期': [date(2024, 1, 1), date(2024, 1, 2)],
+        '单位净值': [1.0234, np.nan],
+        '持股数': [100, 200],
+        '股票代码': ['000001', '600519'],
+    })
+    restored = loads(dumps(frame))
+    pd.testing.assert_frame_equal(restored, frame)
+    assert isinstance(restored['净值日期'][0], date)
+
+
+def test_payload_is_not_pickle(tmp_path):
+    cache = SharedCache(str(tmp_path / "cache.db"))
+    cache.set("k", {'code': '000001', 'nav': 1.5})
+    value, _ = cache.get("k")
+    assert value == {'code': '000001', 'nav': 1.5}
+    raw = cache._connect().execute("SELECT value FROM cache WHERE key = 'k'").fetchone()[0]
+    assert not bytes(raw).startswith(b'\x80')
+
+
+def test_lease_is_exclusive_until_released(tmp_path):
+    cache = SharedCache(str(tmp_path / "cache.db"))
+    assert cache.acquire_lease("k", 10.0)
+    assert not cache.acquire_lease("k", 10.0)
+    cache.release_lease("k")
+    assert cache.acquire_lease("k", 10.0)